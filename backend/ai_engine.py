@@ -1,48 +1,231 @@
 from langchain_groq import ChatGroq
+import groq
 from langchain.schema import HumanMessage
 import os
 from dotenv import load_dotenv
 import json
 import re
+import random
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from provider_pool import build_pool_from_env, is_rate_limited, PoolSaturatedError
 
 # Configuring logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 load_dotenv()
-GROQ_API_KEY = os.getenv("OPENAI_API_KEY")
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+
+# Degraded-mode stores, filled from successful provider responses
+EXPLANATION_CACHE_SIZE = 500
+QUESTION_BANK_SIZE = 200
+QUESTION_BANK_TOPICS = 500
+QUESTION_CACHE_SIZE = 2000
+
+_explanation_cache = OrderedDict()
+_question_bank = OrderedDict()
+_question_cache = OrderedDict()
+_store_lock = threading.Lock()
+
+
+class ProviderUnavailableError(Exception):
+    """Raised when the LLM provider is unavailable and nothing can be served from cache."""
+
+
+class ProviderCallError(Exception):
+    """Raised when a request to the LLM provider fails."""
+
+
+class InvalidProviderResponseError(Exception):
+    """Raised when the provider's response cannot be used and nothing stored can be served instead."""
+
 
+provider_pool = build_pool_from_env(os.environ)
 
-def get_llm():
+
+def get_llm(slot):
+    """Create the Groq LLM client for the API key (and endpoint) in the given pool slot"""
     try:
         return ChatGroq(
             temperature=0.7,
             model_name='llama-3.3-70b-versatile',
-            groq_api_key=GROQ_API_KEY
+            groq_api_key=slot.api_key,
+            groq_api_base=slot.api_base,
+            request_timeout=LLM_REQUEST_TIMEOUT,
+            # Rate limits are retried by _invoke_llm on another key, not on the same one
+            max_retries=0
         )
     except Exception as e:
         raise Exception(f"Failed to initialize Groq LLM: {str(e)}")
 
 
+def _estimate_tokens(prompt, completion_tokens):
+    """Rough token estimate (about 4 characters per token) used to reserve budget before a call"""
+    return len(prompt) // 4 + completion_tokens
+
+
+def _send_prompt(reservation, prompt):
+    """Send a prompt on the reserved API key and record the real usage with the pool"""
+    try:
+        response = get_llm(reservation.slot)([HumanMessage(content=prompt)])
+    except Exception as e:
+        provider_pool.release(reservation, error=e)
+        raise
+
+    provider_pool.release(reservation, response=response)
+    return response
+
+
+def _probe_provider():
+    """Cheap request used by the circuit breaker to check whether the provider has recovered"""
+    prompt = "Reply with OK."
+    _send_prompt(provider_pool.acquire(_estimate_tokens(prompt, 5)), prompt)
+
+
+def _is_provider_outage(error):
+    """
+    Whether an error says the provider itself is unhealthy.
+
+    Only timeouts, connection errors and 5xx responses count. Client errors such as an
+    oversized prompt or a bad key are problems with the request, not with the provider,
+    and a rate limit on one key is handled by the key pool.
+    """
+    if isinstance(error, (groq.APIConnectionError, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, groq.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+provider_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3")),
+    slow_call_threshold=float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "20")),
+    recovery_timeout=float(os.getenv("CIRCUIT_RECOVERY_SECONDS", "30")),
+    probe=_probe_provider,
+    is_failure=_is_provider_outage
+)
+
+
+def _invoke_llm(prompt, completion_tokens=1024):
+    """
+    Send a single prompt to the LLM and return the response content.
+
+    Calls are rejected straight away while the circuit breaker is open. Otherwise the
+    call is scheduled on the pooled API key with the most headroom, queueing briefly
+    if every key is saturated, and then goes through the circuit breaker.
+    Time spent queueing for a key does not count towards the breaker's latency threshold.
+    A rate-limited call puts its key in cooldown and is retried on another key until
+    the pool's wait deadline, after which PoolSaturatedError is raised.
+    """
+    # Fail fast without queueing for a key while the provider is known to be down
+    provider_breaker.check()
+    estimated_tokens = _estimate_tokens(prompt, completion_tokens)
+    deadline = provider_pool.clock() + provider_pool.max_wait
+
+    while True:
+        reservation = provider_pool.acquire(estimated_tokens, deadline=deadline)
+
+        try:
+            response = provider_breaker.call(_send_prompt, reservation, prompt)
+        except CircuitOpenError:
+            provider_pool.release(reservation, refund=True)
+            raise
+        except Exception as e:
+            if is_rate_limited(e):
+                logger.warning(f"API key {reservation.slot.name} rate limited; retrying on another key")
+                continue
+            raise ProviderCallError(f"LLM provider request failed: {str(e)}") from e
+
+        return response.content
+
+
+# Errors meaning the provider could not answer, as opposed to bugs in handling its answer
+PROVIDER_ERRORS = (ProviderCallError, CircuitOpenError, PoolSaturatedError)
+
+
+def _raise_provider_failure(error, action):
+    """Helper function to surface a provider failure when nothing cached can be served instead"""
+    if isinstance(error, (CircuitOpenError, PoolSaturatedError)):
+        raise ProviderUnavailableError("The AI provider is temporarily unavailable. Please try again shortly.")
+    raise Exception(f"Failed to {action}: {str(error)}")
+
+
+def _explanation_key(subject, level, question, learning_style, background, language):
+    normalized_question = " ".join(question.lower().split())
+    return (subject.lower(), level.lower(), normalized_question, learning_style, background, language)
+
+
+def _cache_explanation(key, explanation):
+    with _store_lock:
+        _explanation_cache[key] = explanation
+        _explanation_cache.move_to_end(key)
+        while len(_explanation_cache) > EXPLANATION_CACHE_SIZE:
+            _explanation_cache.popitem(last=False)
+
+
+def _get_cached_explanation(key):
+    with _store_lock:
+        return _explanation_cache.get(key)
+
+
+def _store_quiz_questions(subject, level, quiz_data):
+    """Keep successfully generated questions so they can be served while the provider is down"""
+    key = (subject.lower(), level.lower())
+    with _store_lock:
+        bank = _question_bank.setdefault(key, [])
+        _question_bank.move_to_end(key)
+        while len(_question_bank) > QUESTION_BANK_TOPICS:
+            _question_bank.popitem(last=False)
+
+        known = {q["question"] for q in bank}
+        for question in quiz_data:
+            if question["question"] not in known:
+                bank.append(dict(question))
+                known.add(question["question"])
+        del bank[:-QUESTION_BANK_SIZE]
+
+
+def _get_stored_questions(subject, level, num_questions):
+    key = (subject.lower(), level.lower())
+    with _store_lock:
+        bank = list(_question_bank.get(key, []))
+    picked = random.sample(bank, min(num_questions, len(bank)))
+    return [dict(question) for question in picked]
+
+
 def generate_tutoring_response(subject, level, question, learning_style, background, language):
     """
     Generate a personalized tutoring response based on user preferences.
+
+    Returns:
+        dict: Contains the explanation and whether it was served from cache because
+        the provider was unavailable ("degraded").
     """
+    cache_key = _explanation_key(subject, level, question, learning_style, background, language)
+    prompt = _create_tutoring_prompt(subject, level, question, learning_style, background, language)
+
+    logger.info(f"Generating tutoring response for subject: {subject}, level: {level}, language: {language}")
     try:
-        llm = get_llm()  # ✅ Assign the LLM instance
+        content = _invoke_llm(prompt)
+    except PROVIDER_ERRORS as e:
+        logger.error(f"Error generating tutoring response: {str(e)}")
 
-        prompt = _create_tutoring_prompt(subject, level, question, learning_style, background, language)
+        cached = _get_cached_explanation(cache_key)
+        if cached is None:
+            _raise_provider_failure(e, "generate tutoring response")
 
-        logger.info(f"Generating tutoring response for subject: {subject}, level: {level}, language: {language}")
-        response = llm([HumanMessage(content=prompt)])  # ✅ Now works
+        logger.warning(f"Serving cached explanation for subject: {subject}, level: {level}")
+        return {"response": cached, "degraded": True}
 
-        return _format_tutoring_response(response.content, learning_style)
-
-    except Exception as e:
-        logger.error(f"Error generating tutoring response: {str(e)}")
-        raise Exception(f"Failed to generate tutoring response: {str(e)}")
+    explanation = _format_tutoring_response(content, learning_style)
+    _cache_explanation(cache_key, explanation)
 
+    return {"response": explanation, "degraded": False}
 
 
 def _create_tutoring_prompt(subject, level, question, learning_style, background, language):
@@ -118,21 +301,6 @@ def _create_quiz_prompt(subject, level, num_questions):
     """
 
 
-def _create_fallback_quiz(subject, num_questions):
-    """Helper function to create a fallback quiz if parsing fails"""
-    logger.warning(f"Using fallback quiz for subject: {subject}")
-
-    return [
-        {
-            "question": f"Sample {subject} Question #{i + 1}",
-            "options": ["Option A", "Option B", "Option C", "Option D"],
-            "correct_answer": "Option A",
-            "explanation": "This is a sample explanation."
-        }
-        for i in range(num_questions)
-    ]
-
-
 def _validate_quiz_data(quiz_data):
     """Helper function to validate quiz data structure"""
 
@@ -150,43 +318,231 @@ def _validate_quiz_data(quiz_data):
             raise ValueError("Each question must have exactly 4 options.")
 
 
-def _parse_quiz_response(response_content, subject, num_questions):
-    """Helper function to parse and validate the quiz response."""
+def _extract_quiz_data(response_content, num_questions):
+    """Helper function to extract and validate quiz data, raising on malformed responses."""
 
-    try:
-        json_match = re.search(r'```json\s*(\[[\sS]*?\])\s*```', response_content)
+    json_match = re.search(r'```json\s*(\[[\sS]*?\])\s*```', response_content)
 
+    if json_match:
+        quiz_json = json_match.group(1)
+    else:
+        json_match = re.search(r'\[\s*\{.*\}\s*\]', response_content, re.DOTALL)
         if json_match:
-            quiz_json = json_match.group(1)
+            quiz_json = json_match.group(0)
         else:
-            json_match = re.search(r'\[\s*\{.*\}\s*\]', response_content, re.DOTALL)
-            if json_match:
-                quiz_json = json_match.group(0)
-            else:
-                quiz_json = response_content
-        
-        quiz_data = json.loads(quiz_json)
+            quiz_json = response_content
 
-        _validate_quiz_data(quiz_data)
+    quiz_data = json.loads(quiz_json)
 
-        if len(quiz_data) > num_questions:
-            quiz_data = quiz_data[:num_questions]
+    _validate_quiz_data(quiz_data)
 
-        for question in quiz_data:
-            if "explanation" not in question:
-                question["explanation"] = f"The correct answer is {question['correct_answer']}."
-            if "hint" not in question or not question["hint"]:
-                question["hint"] = "Think carefully about the key concept here."
-            
-        return quiz_data
-    
-    except (json.JSONDecodeError, ValueError) as e:
-        logger.error(f"Error parsing quiz response: {str(e)}")
+    if len(quiz_data) > num_questions:
+        quiz_data = quiz_data[:num_questions]
 
-        return _create_fallback_quiz(subject, num_questions)
+    for question in quiz_data:
+        _fill_question_defaults(question)
 
+    return quiz_data
 
-def generate_quiz(subject, level, num_questions=5, reveal_answer=True):
+
+def _fill_question_defaults(question):
+    """Helper function to add a default explanation and hint when the model left them out"""
+    if "explanation" not in question:
+        question["explanation"] = f"The correct answer is {question['correct_answer']}."
+    if "hint" not in question or not question["hint"]:
+        question["hint"] = "Think carefully about the key concept here."
+
+
+def _create_subtopic_prompt(subject, level, num_questions, known_subtopics):
+    """
+    Helper function to create the prompt that plans one subtopic per quiz question
+    """
+    known = ""
+    if known_subtopics:
+        known = f"\n    Where suitable, reuse these existing subtopic names exactly: {json.dumps(known_subtopics)}\n"
+
+    return f"""
+    List exactly {num_questions} distinct subtopics of {subject} suitable for a {level} level quiz,
+    one subtopic per question, covering diverse aspects of {subject}.
+    {known}
+    FORMAT YOUR RESPONSE AS A JSON ARRAY OF SHORT STRINGS, for example:
+    ["Subtopic one", "Subtopic two"]
+
+    IMPORTANT: Return only the JSON array, with no text outside it.
+    """
+
+
+def _create_question_prompt(subject, level, subtopic, variant=0):
+    """
+    Helper function to create the prompt for a single multiple-choice question on a subtopic.
+    Variants above 0 ask for further questions on a subtopic that already has one.
+    """
+    focus = ""
+    if variant:
+        focus = f"\n    This is question #{variant + 1} on this subtopic, so test a less obvious aspect of it.\n"
+
+    return f"""
+    Write one {level} level multiple-choice question on {subject}, focused on the subtopic "{subtopic}".
+    {focus}
+    INSTRUCTIONS:
+    1. The question must have exactly 4 answer options.
+    2. The correct answer must be one of the options, copied exactly.
+    3. Include a brief hint that helps without giving away the answer.
+
+    FORMAT YOUR RESPONSE AS JSON:
+        {{
+            "question": "Question text",
+            "options": ["Option A", "Option B", "Option C", "Option D"],
+            "correct_answer": "Option A",
+            "hint": "Brief helpful hint for this question",
+            "explanation": "Brief explanation of why this answer is correct"
+        }}
+
+    IMPORTANT: Return only the JSON object, with no text outside it.
+    """
+
+
+def _parse_subtopics(response_content, num_questions):
+    """Helper function to parse the planned subtopics, raising on malformed responses."""
+
+    json_match = re.search(r'\[.*\]', response_content, re.DOTALL)
+    subtopics = json.loads(json_match.group(0) if json_match else response_content)
+
+    if not isinstance(subtopics, list):
+        raise ValueError("Subtopics must be a list.")
+
+    unique_subtopics = {}
+    for subtopic in subtopics:
+        subtopic = " ".join(str(subtopic).split())
+        if subtopic and subtopic.lower() not in unique_subtopics:
+            unique_subtopics[subtopic.lower()] = subtopic
+
+    if not unique_subtopics:
+        raise ValueError("No subtopics were returned.")
+
+    return list(unique_subtopics.values())[:num_questions]
+
+
+def _plan_question_slots(subtopics, num_questions):
+    """
+    Helper function to assign a (subtopic, variant) pair to every question.
+
+    When the planner returned fewer subtopics than questions, the extra questions
+    become further variants of the subtopics, each with its own cache entry.
+    """
+    return [(subtopics[i % len(subtopics)], i // len(subtopics)) for i in range(num_questions)]
+
+
+def _parse_single_question(response_content):
+    """Helper function to parse and validate a single generated question, raising on malformed responses."""
+
+    json_match = re.search(r'\{.*\}', response_content, re.DOTALL)
+    question = json.loads(json_match.group(0) if json_match else response_content)
+
+    _validate_quiz_data([question])
+    if question["correct_answer"] not in question["options"]:
+        raise ValueError("The correct answer must be one of the options.")
+
+    _fill_question_defaults(question)
+    return question
+
+
+def _question_key(subject, level, subtopic, variant=0):
+    return (subject.lower(), level.lower(), " ".join(subtopic.lower().split()), variant)
+
+
+def _cache_question(key, question):
+    with _store_lock:
+        _question_cache[key] = dict(question)
+        _question_cache.move_to_end(key)
+        while len(_question_cache) > QUESTION_CACHE_SIZE:
+            _question_cache.popitem(last=False)
+
+
+def _get_cached_question(key):
+    with _store_lock:
+        question = _question_cache.get(key)
+    return dict(question) if question is not None else None
+
+
+def _get_cached_subtopics(subject, level, limit=20):
+    """Subtopics already cached for this subject and level, offered to the planner for reuse"""
+    subject, level = subject.lower(), level.lower()
+    with _store_lock:
+        subtopics = [key[2] for key in _question_cache if key[0] == subject and key[1] == level]
+    return list(dict.fromkeys(subtopics))[-limit:]
+
+
+def _generate_topic_question(subject, level, subtopic, variant=0):
+    """Return the cached question for a subtopic variant, generating and caching it on a miss"""
+    key = _question_key(subject, level, subtopic, variant)
+
+    question = _get_cached_question(key)
+    if question is not None:
+        return question
+
+    prompt = _create_question_prompt(subject, level, subtopic, variant)
+    question = _parse_single_question(_invoke_llm(prompt, completion_tokens=300))
+    _cache_question(key, question)
+    return question
+
+
+def _generate_quiz_by_topic(subject, level, num_questions):
+    """
+    Plan one subtopic per question in a single short call, then generate the questions in parallel.
+
+    Each question is a small independent call, so a malformed item only loses that item,
+    and questions are cached by (subject, level, subtopic) for reuse in later quizzes.
+    Questions that failed or came back duplicated are made up with one regular quiz prompt.
+    Raises ValueError if the plan cannot be parsed or the quiz still comes up short.
+    """
+    known_subtopics = _get_cached_subtopics(subject, level)
+    prompt = _create_subtopic_prompt(subject, level, num_questions, known_subtopics)
+
+    logger.info(f"Planning {num_questions} subtopics for subject: {subject}, level: {level}")
+    subtopics = _parse_subtopics(_invoke_llm(prompt, completion_tokens=20 * num_questions), num_questions)
+    slots = _plan_question_slots(subtopics, num_questions)
+
+    def _generate(slot):
+        subtopic, variant = slot
+        try:
+            return _generate_topic_question(subject, level, subtopic, variant)
+        except (json.JSONDecodeError, ValueError) + PROVIDER_ERRORS as e:
+            logger.error(f"Error generating question for subtopic '{subtopic}': {str(e)}")
+            return e
+
+    with ThreadPoolExecutor(max_workers=num_questions) as executor:
+        results = list(executor.map(_generate, slots))
+
+    # With the circuit open or every key saturated, a top-up call cannot succeed either
+    for result in results:
+        if isinstance(result, (CircuitOpenError, PoolSaturatedError)):
+            raise result
+
+    quiz_data = []
+    seen = set()
+
+    def _add(questions):
+        for question in questions:
+            if len(quiz_data) < num_questions and isinstance(question, dict) and question["question"] not in seen:
+                quiz_data.append(question)
+                seen.add(question["question"])
+
+    _add(results)
+
+    missing = num_questions - len(quiz_data)
+    if missing:
+        logger.warning(f"Generating {missing} missing questions with a single prompt for subject: {subject}")
+        content = _invoke_llm(_create_quiz_prompt(subject, level, missing), completion_tokens=250 * missing)
+        _add(_extract_quiz_data(content, missing))
+
+    if len(quiz_data) < num_questions:
+        raise ValueError(f"Only {len(quiz_data)} of {num_questions} questions could be generated.")
+
+    return quiz_data
+
+
+def generate_quiz(subject, level, num_questions=5, reveal_answer=True, by_topic=False):
     """Generate quiz with multiple choice questions based on subject and level
 
     Args:
@@ -194,34 +550,68 @@ def generate_quiz(subject, level, num_questions=5, reveal_answer=True):
         level (str): The educational level (e.g., Beginner, Intermediate, Advanced).
         num_questions (int): Number of questions in the quiz.
         reveal_answer (bool): Whether to include correct answers and explanations in the response.
+        by_topic (bool): Plan one subtopic per question and generate the questions in parallel,
+            reusing cached questions for previously seen subtopics.
 
     Returns:
         dict: Contain the quiz data (list of questions) and formatted HTML if reveal_answer is True.
+        "degraded" is True when the questions were served from the stored question bank,
+        either because the provider was unavailable or because its response could not be parsed.
     """
-    formatted_quiz = None
+    degraded = False
+    quiz_data = None
     try:
-        llm = get_llm()
+        if by_topic:
+            try:
+                quiz_data = _generate_quiz_by_topic(subject, level, num_questions)
+                _store_quiz_questions(subject, level, quiz_data)
+            except (json.JSONDecodeError, ValueError) as e:
+                logger.error(f"Error generating quiz by topic, falling back to a single prompt: {str(e)}")
+
+        if quiz_data is None:
+            prompt = _create_quiz_prompt(subject, level, num_questions)
+
+            logger.info(f"Generating quiz for subject: {subject}, level: {level}, questions: {num_questions}")
+            content = _invoke_llm(prompt, completion_tokens=250 * num_questions)
+
+            try:
+                quiz_data = _extract_quiz_data(content, num_questions)
+                _store_quiz_questions(subject, level, quiz_data)
+            except (json.JSONDecodeError, ValueError) as e:
+                logger.error(f"Error parsing quiz response: {str(e)}")
+                quiz_data = _get_stored_questions(subject, level, num_questions)
+                if not quiz_data:
+                    raise InvalidProviderResponseError("The AI provider returned a quiz that could not be read. Please try again.")
+
+                logger.warning(f"Serving {len(quiz_data)} stored questions for subject: {subject}, level: {level}")
+                degraded = True
+
+    except PROVIDER_ERRORS as e:
+        logger.error(f"Error generating quiz: {str(e)}")
 
-        prompt = _create_quiz_prompt(subject, level, num_questions)
+        quiz_data = _get_stored_questions(subject, level, num_questions)
+        if not quiz_data:
+            _raise_provider_failure(e, "generate quiz")
 
-        logger.info(f"Generating quiz for subject: {subject}, level: {level}, questions: {num_questions}")
-        response = llm([HumanMessage(content=prompt)])
+        logger.warning(f"Serving {len(quiz_data)} stored questions for subject: {subject}, level: {level}")
+        degraded = True
 
-        quiz_data = _parse_quiz_response(response.content, subject, num_questions)
+    return _build_quiz_result(quiz_data, reveal_answer, degraded)
 
-        if reveal_answer:
-            formatted_quiz = _format_quiz_with_reveal(quiz_data)
-            return {
-                "quiz_data": quiz_data,
-                "formatted_quiz": formatted_quiz
-            }
-        else:
-            return {
-                "quiz_data": quiz_data
-            }
-    except Exception as e:
-        logger.error(f"Error generating quiz: {str(e)}")
-        raise Exception(f"Failed to generate quiz: {str(e)}")
+
+def _build_quiz_result(quiz_data, reveal_answer, degraded):
+    """Helper function to assemble the generate_quiz result"""
+    if reveal_answer:
+        return {
+            "quiz_data": quiz_data,
+            "formatted_quiz": _format_quiz_with_reveal(quiz_data),
+            "degraded": degraded
+        }
+    else:
+        return {
+            "quiz_data": quiz_data,
+            "degraded": degraded
+        }
 
 
 def _format_quiz_with_reveal(quiz_data):
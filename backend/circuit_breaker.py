@@ -0,0 +1,129 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker around the LLM provider.
+
+    The breaker opens after `failure_threshold` consecutive failures. Calls that
+    take longer than `slow_call_threshold` seconds count as failures too, since a
+    throttled provider is usually slow before it starts erroring. While open,
+    calls are rejected immediately and a background thread runs `probe` every
+    `recovery_timeout` seconds until it succeeds, which closes the breaker again.
+
+    `is_failure` decides which exceptions say something about the provider's health;
+    others, such as a request the provider rejected as invalid, are re-raised
+    without being recorded. By default every exception counts.
+
+    `clock` and `sleep` default to the real time functions and can be replaced in tests.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+
+    def __init__(self, failure_threshold=3, slow_call_threshold=20.0, recovery_timeout=30.0, probe=None,
+                 is_failure=None, clock=time.monotonic, sleep=time.sleep):
+        self.failure_threshold = failure_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.recovery_timeout = recovery_timeout
+        self.probe = probe
+        self.is_failure = is_failure
+        self.clock = clock
+        self.sleep = sleep
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._probe_thread = None
+
+    @property
+    def state(self):
+        return self._state
+
+    def is_open(self):
+        return self._state == self.OPEN
+
+    def check(self):
+        """Raise CircuitOpenError if the breaker is open."""
+        if self.is_open():
+            raise CircuitOpenError("LLM provider circuit is open; failing fast")
+
+    def call(self, func, *args, **kwargs):
+        """Run `func` through the breaker, raising CircuitOpenError if it is open."""
+        self.check()
+
+        start = self.clock()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if self.is_failure is None or self.is_failure(e):
+                self._record_failure(f"error: {str(e)}")
+            raise
+
+        elapsed = self.clock() - start
+        if elapsed > self.slow_call_threshold:
+            self._record_failure(f"slow call ({elapsed:.1f}s)")
+        else:
+            self._record_success()
+
+        return result
+
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def _record_failure(self, reason):
+        with self._lock:
+            self._failures += 1
+            logger.warning(f"LLM provider failure {self._failures}/{self.failure_threshold}: {reason}")
+
+            if self._state == self.CLOSED and self._failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        """Open the breaker and start the recovery probe. Caller must hold the lock."""
+        self._state = self.OPEN
+        logger.error("LLM provider circuit opened; serving degraded responses")
+
+        if self._probe_thread is None or not self._probe_thread.is_alive():
+            self._probe_thread = threading.Thread(target=self._probe_until_recovered, daemon=True)
+            self._probe_thread.start()
+
+    def _close(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            # The probe thread exits right after closing, so a later opening must start a new one
+            self._probe_thread = None
+        logger.info("LLM provider circuit closed; provider recovered")
+
+    def _probe_until_recovered(self):
+        while self.is_open():
+            self.sleep(self.recovery_timeout)
+
+            if self.probe is None:
+                self._close()
+                return
+
+            start = self.clock()
+            try:
+                self.probe()
+            except Exception as e:
+                logger.info(f"LLM provider recovery probe failed: {str(e)}")
+                continue
+
+            elapsed = self.clock() - start
+            if elapsed > self.slow_call_threshold:
+                logger.info(f"LLM provider recovery probe too slow ({elapsed:.1f}s)")
+                continue
+
+            self._close()
+            return
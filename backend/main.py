@@ -6,7 +6,7 @@ import os
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 
-from ai_engine import generate_tutoring_response, generate_quiz
+from ai_engine import generate_tutoring_response, generate_quiz, provider_breaker, ProviderUnavailableError, InvalidProviderResponseError
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -38,6 +38,7 @@ class QuizRequest(BaseModel):
     level: str = Field(..., description="Learning level")
     num_questions: int = Field(5, description="Number of quiz questions", ge=1, le=10)
     reveal_format: Optional[bool] = Field(True, description="Whether to format with hidden answers")
+    by_topic: bool = Field(False, description="Generate one question per planned subtopic in parallel, reusing cached questions")
 
 class quizQuestion(BaseModel):
     question: str
@@ -47,18 +48,20 @@ class quizQuestion(BaseModel):
 
 class TutorResponse(BaseModel):
     response: str
+    degraded: bool = False
 
 class quizResponse(BaseModel):
     quiz: List[Dict[str, Any]]
     formatted_quiz: Optional[str] = None
+    degraded: bool = False
 
 @app.post("/tutor", response_model=TutorResponse)
-async def get_tutoring_response(data: TutorRequest):
+def get_tutoring_response(data: TutorRequest):
     """
     Generate a personalizedd tutoring explanation based on user preferences.
     """
     try:
-        explanation = generate_tutoring_response(
+        return generate_tutoring_response(
             data.subject,
             data.level,
             data.question,
@@ -66,12 +69,13 @@ async def get_tutoring_response(data: TutorRequest):
             data.background,
             data.language,
         )
-        return {"response" : explanation}
+    except ProviderUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating explanation: {str(e)}")
     
 @app.post("/quiz", response_model=quizResponse)
-async def generate_quiz_api(data: QuizRequest):
+def generate_quiz_api(data: QuizRequest):
     """
     Generate a quizwith multiple-choice questions based on the subject and level.
     """
@@ -80,30 +84,41 @@ async def generate_quiz_api(data: QuizRequest):
             data.subject,
             data.level,
             data.num_questions,
-            reveal_answer=data.reveal_format
+            reveal_answer=data.reveal_format,
+            by_topic=data.by_topic
         )
         
         if data.reveal_format:
             return {
                 "quiz": quiz_result["quiz_data"],
-                "formatted_quiz": quiz_result["formatted_quiz"]
+                "formatted_quiz": quiz_result["formatted_quiz"],
+                "degraded": quiz_result["degraded"]
             }
         else:
             return {
-                "quiz": quiz_result["quiz_data"]
+                "quiz": quiz_result["quiz_data"],
+                "degraded": quiz_result["degraded"]
             }
+    except ProviderUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except InvalidProviderResponseError as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating quiz: {str(e)}")
     
 
 @app.get("/quiz-html/{subject}/{level}/{num_questions}", response_class=HTMLResponse)
-async def get_quiz_html(subject:str, level:str, num_questions: int = 5):
+def get_quiz_html(subject:str, level:str, num_questions: int = 5):
     """
     Get a formatted HTML quiz page
     """
     try:
         quiz_result = generate_quiz(subject, level, num_questions, reveal_answer=True)
         return quiz_result["formatted_quiz"]
+    except ProviderUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except InvalidProviderResponseError as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating quiz: {str(e)}")
     
@@ -112,4 +127,4 @@ async def health_check():
     """
     Health check endpoint to verify API is running.
     """
-    return {"status": "API is running"}
\ No newline at end of file
+    return {"status": "API is running", "llm_provider": provider_breaker.state}
\ No newline at end of file
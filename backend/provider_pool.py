@@ -0,0 +1,239 @@
+import threading
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = 60.0
+
+
+class PoolSaturatedError(Exception):
+    """Raised when no API key has budget left within the allowed wait time."""
+
+
+class KeySlot:
+    """
+    A single API key (and optional endpoint) with its per-minute request and token budget.
+
+    Usage is tracked locally in a sliding one-minute window. Each acquired call
+    reserves its estimated tokens up front and the reservation is corrected with
+    the real token count once the response arrives.
+    """
+
+    def __init__(self, name, api_key, api_base=None, rpm_limit=30, tpm_limit=12000):
+        self.name = name
+        self.api_key = api_key
+        self.api_base = api_base
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+
+        self._usage = deque()  # [timestamp, tokens] entries within the window
+        self.cooldown_until = 0.0
+
+    def _expire(self, now):
+        while self._usage and now - self._usage[0][0] >= WINDOW_SECONDS:
+            self._usage.popleft()
+
+    def remaining(self, now):
+        self._expire(now)
+        used_tokens = sum(entry[1] for entry in self._usage)
+        return self.rpm_limit - len(self._usage), self.tpm_limit - used_tokens
+
+    def headroom(self, now, tokens):
+        """Fraction of budget left after this call, or None if the key cannot take it now."""
+        if now < self.cooldown_until:
+            return None
+
+        remaining_requests, remaining_tokens = self.remaining(now)
+        # A call larger than the whole token budget is allowed on an idle key
+        needed_tokens = min(tokens, self.tpm_limit)
+        if remaining_requests < 1 or remaining_tokens < needed_tokens:
+            return None
+
+        return min((remaining_requests - 1) / self.rpm_limit, (remaining_tokens - needed_tokens) / self.tpm_limit)
+
+    def next_available(self, now):
+        """Earliest time at which some budget frees up on this key."""
+        if now < self.cooldown_until:
+            return self.cooldown_until
+        if self._usage:
+            return self._usage[0][0] + WINDOW_SECONDS
+        return now
+
+    def reserve(self, now, tokens):
+        entry = [now, tokens]
+        self._usage.append(entry)
+        return entry
+
+    def cancel(self, entry):
+        try:
+            self._usage.remove(entry)
+        except ValueError:
+            pass
+
+
+class Reservation:
+    """Handle returned by ProviderPool.acquire, passed back to ProviderPool.release."""
+
+    def __init__(self, slot, entry):
+        self.slot = slot
+        self.entry = entry
+
+
+class ProviderPool:
+    """
+    Pool of API keys that sends each call to the key with the most request and token headroom.
+
+    When every key is saturated, `acquire` waits up to `max_wait` seconds for
+    budget to free up before raising PoolSaturatedError. `clock` defaults to
+    time.monotonic and can be replaced in tests.
+    """
+
+    def __init__(self, slots, max_wait=10.0, clock=time.monotonic):
+        if not slots:
+            raise ValueError("Provider pool needs at least one API key.")
+
+        self.slots = slots
+        self.max_wait = max_wait
+        self.clock = clock
+        self._condition = threading.Condition()
+
+    def acquire(self, estimated_tokens, deadline=None):
+        """
+        Reserve budget on the key with the most headroom, waiting until `deadline`
+        (by default `max_wait` seconds from now) if every key is saturated.
+        """
+        if deadline is None:
+            deadline = self.clock() + self.max_wait
+
+        with self._condition:
+            while True:
+                now = self.clock()
+                best_slot, best_headroom = None, None
+                for slot in self.slots:
+                    headroom = slot.headroom(now, estimated_tokens)
+                    if headroom is not None and (best_headroom is None or headroom > best_headroom):
+                        best_slot, best_headroom = slot, headroom
+
+                if best_slot is not None:
+                    return Reservation(best_slot, best_slot.reserve(now, estimated_tokens))
+
+                if now >= deadline:
+                    raise PoolSaturatedError("All API keys are at their rate limits; please try again shortly.")
+
+                wake_at = min(slot.next_available(now) for slot in self.slots)
+                wait = min(max(wake_at - now, 0.05), deadline - now)
+                logger.info(f"All API keys saturated; queueing call for up to {wait:.1f}s")
+                self._condition.wait(wait)
+
+    def release(self, reservation, response=None, error=None, refund=False):
+        """
+        Correct the reservation with real usage, or handle a failed call.
+
+        Rate-limited calls put the key in cooldown. The budget of any other failed call
+        is given back, so an outage does not leave every key looking saturated. Pass
+        refund=True when the call never reached the provider.
+        """
+        with self._condition:
+            if refund:
+                reservation.slot.cancel(reservation.entry)
+
+            elif response is not None:
+                token_usage = getattr(response, "response_metadata", {}).get("token_usage", {})
+                if token_usage.get("total_tokens"):
+                    reservation.entry[1] = token_usage["total_tokens"]
+
+            elif error is not None:
+                retry_after = _retry_after_seconds(error)
+                if retry_after is not None:
+                    reservation.slot.cooldown_until = self.clock() + retry_after
+                    logger.warning(f"API key {reservation.slot.name} rate limited; cooling down for {retry_after:.1f}s")
+                else:
+                    reservation.slot.cancel(reservation.entry)
+
+            self._condition.notify_all()
+
+
+def is_rate_limited(error):
+    """Whether an error is a rate-limit (429) response."""
+    return _retry_after_seconds(error) is not None
+
+
+def _retry_after_seconds(error):
+    """Extract a cooldown from a rate-limit error, or None if the error is not a rate limit."""
+    response = getattr(error, "response", None)
+    if getattr(error, "status_code", None) != 429 and getattr(response, "status_code", None) != 429:
+        return None
+
+    headers = getattr(response, "headers", None) or {}
+    for header in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        value = headers.get(header)
+        if value:
+            seconds = _parse_duration(value)
+            if seconds is not None:
+                return seconds
+
+    return WINDOW_SECONDS
+
+
+def _parse_duration(value):
+    """Parse a rate-limit reset value such as "7.66", "2m59.56s" or "450ms" into seconds."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    total = 0.0
+    number = ""
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char.isdigit() or char == ".":
+            number += char
+            i += 1
+            continue
+
+        unit = "ms" if value[i:i + 2] == "ms" else char
+        if unit not in units or not number:
+            return None
+        total += float(number) * units[unit]
+        number = ""
+        i += len(unit)
+
+    return total if not number else None
+
+
+def build_pool_from_env(env):
+    """
+    Build a ProviderPool from environment settings.
+
+    GROQ_API_KEYS is a comma-separated list of keys (falling back to the single
+    OPENAI_API_KEY), and GROQ_API_BASES an optional comma-separated list of
+    endpoints aligned with the keys.
+    """
+    keys = [key.strip() for key in env.get("GROQ_API_KEYS", "").split(",") if key.strip()]
+    if not keys and env.get("OPENAI_API_KEY"):
+        keys = [env["OPENAI_API_KEY"]]
+
+    bases = [base.strip() for base in env.get("GROQ_API_BASES", "").split(",")]
+    rpm_limit = int(env.get("GROQ_RPM_LIMIT", "30"))
+    tpm_limit = int(env.get("GROQ_TPM_LIMIT", "12000"))
+
+    slots = [
+        KeySlot(
+            name=f"key-{i + 1}",
+            api_key=key,
+            api_base=bases[i] if i < len(bases) and bases[i] else None,
+            rpm_limit=rpm_limit,
+            tpm_limit=tpm_limit
+        )
+        for i, key in enumerate(keys)
+    ]
+
+    # Without configured keys, ChatGroq falls back to its own GROQ_API_KEY lookup
+    if not slots:
+        slots = [KeySlot(name="key-1", api_key=None, rpm_limit=rpm_limit, tpm_limit=tpm_limit)]
+
+    return ProviderPool(slots, max_wait=float(env.get("GROQ_POOL_MAX_WAIT", "10")))
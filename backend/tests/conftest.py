@@ -0,0 +1,82 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import httpx
+import pytest
+
+# The backend modules are imported by name, as in main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import groq  # noqa: E402
+
+import ai_engine  # noqa: E402
+from circuit_breaker import CircuitBreaker  # noqa: E402
+from provider_pool import KeySlot, ProviderPool  # noqa: E402
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+        self.response_metadata = {"token_usage": {"total_tokens": len(content) // 4 + 1}}
+
+
+class FakeProvider:
+    """
+    Stands in for ChatGroq. `reply` is called with each prompt (and the API key used)
+    and returns the response text or raises.
+    """
+
+    def __init__(self):
+        self.reply = lambda prompt, api_key: "OK"
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get_llm(self, slot):
+        def _llm(messages):
+            prompt = messages[0].content
+            with self._lock:
+                self.calls.append((slot.api_key, prompt))
+            return FakeMessage(self.reply(prompt, slot.api_key))
+        return _llm
+
+    @staticmethod
+    def status_error(status_code, headers=None):
+        request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+        response = httpx.Response(status_code, headers=headers, request=request)
+        error_class = {
+            400: groq.BadRequestError,
+            401: groq.AuthenticationError,
+            429: groq.RateLimitError,
+        }.get(status_code, groq.InternalServerError)
+        return error_class(f"Error code: {status_code}", response=response, body=None)
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """Route ai_engine through a fake provider with a fresh breaker, key pool and caches."""
+    fake = FakeProvider()
+    stop_probe = threading.Event()
+
+    breaker = CircuitBreaker(
+        failure_threshold=2,
+        probe=None,
+        is_failure=ai_engine._is_provider_outage,
+        sleep=lambda seconds: stop_probe.wait(),
+    )
+    pool = ProviderPool([KeySlot("key-1", "key-a"), KeySlot("key-2", "key-b")], max_wait=0)
+
+    monkeypatch.setattr(ai_engine, "get_llm", fake.get_llm)
+    monkeypatch.setattr(ai_engine, "provider_breaker", breaker)
+    monkeypatch.setattr(ai_engine, "provider_pool", pool)
+    monkeypatch.setattr(ai_engine, "_explanation_cache", OrderedDict())
+    monkeypatch.setattr(ai_engine, "_question_bank", OrderedDict())
+    monkeypatch.setattr(ai_engine, "_question_cache", OrderedDict())
+
+    fake.breaker = breaker
+    fake.pool = pool
+    yield fake
+
+    # Lets a waiting probe thread close the breaker and exit
+    stop_probe.set()
@@ -0,0 +1,168 @@
+import threading
+
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def _fail():
+    raise RuntimeError("provider down")
+
+
+def _slow_call(clock, seconds):
+    def _call():
+        clock.advance(seconds)
+        return "ok"
+    return _call
+
+
+def _blocked_sleep():
+    """A sleep that waits until the test releases it, so the probe runs only when asked to."""
+    gate = threading.Semaphore(0)
+
+    def _sleep(seconds):
+        gate.acquire(timeout=5)
+
+    return gate, _sleep
+
+
+def _wait_for_probe(breaker):
+    thread = breaker._probe_thread
+    if thread is not None:
+        thread.join(timeout=5)
+
+
+def test_opens_after_failure_threshold():
+    gate, sleep = _blocked_sleep()
+    breaker = CircuitBreaker(failure_threshold=3, probe=lambda: None, sleep=sleep)
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            breaker.call(_fail)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    with pytest.raises(RuntimeError):
+        breaker.call(_fail)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    called = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: called.append(True))
+    assert called == []
+
+
+def test_success_resets_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, probe=lambda: None)
+
+    with pytest.raises(RuntimeError):
+        breaker.call(_fail)
+    assert breaker.call(lambda: "ok") == "ok"
+    with pytest.raises(RuntimeError):
+        breaker.call(_fail)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_slow_calls_count_as_failures():
+    clock = FakeClock()
+    gate, sleep = _blocked_sleep()
+    breaker = CircuitBreaker(failure_threshold=2, slow_call_threshold=5.0, probe=lambda: None,
+                             clock=clock, sleep=sleep)
+
+    assert breaker.call(_slow_call(clock, 4.0)) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    # Slow calls still return their result, but open the breaker once over the threshold
+    assert breaker.call(_slow_call(clock, 6.0)) == "ok"
+    assert breaker.call(_slow_call(clock, 6.0)) == "ok"
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_probe_closes_breaker_after_recovery():
+    gate, sleep = _blocked_sleep()
+    healthy = {"value": False}
+
+    def probe():
+        if not healthy["value"]:
+            raise RuntimeError("still down")
+
+    breaker = CircuitBreaker(failure_threshold=1, probe=probe, sleep=sleep)
+    with pytest.raises(RuntimeError):
+        breaker.call(_fail)
+    assert breaker.is_open()
+
+    # First probe fails, so the breaker stays open
+    gate.release()
+    healthy["value"] = True
+    gate.release()
+    _wait_for_probe(breaker)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.call(lambda: "ok") == "ok"
+
+
+def test_slow_probe_does_not_close_breaker():
+    clock = FakeClock()
+    gate, sleep = _blocked_sleep()
+    probes = []
+
+    def probe():
+        probes.append(True)
+        clock.advance(10.0 if len(probes) == 1 else 1.0)
+
+    breaker = CircuitBreaker(failure_threshold=1, slow_call_threshold=5.0, probe=probe,
+                             clock=clock, sleep=sleep)
+    with pytest.raises(RuntimeError):
+        breaker.call(_fail)
+
+    gate.release()
+    gate.release()
+    _wait_for_probe(breaker)
+
+    assert len(probes) == 2
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_reopening_after_recovery_starts_a_new_probe():
+    gate, sleep = _blocked_sleep()
+    breaker = CircuitBreaker(failure_threshold=1, probe=lambda: None, sleep=sleep)
+
+    with pytest.raises(RuntimeError):
+        breaker.call(_fail)
+    gate.release()
+    _wait_for_probe(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    with pytest.raises(RuntimeError):
+        breaker.call(_fail)
+    assert breaker.is_open()
+    assert breaker._probe_thread is not None and breaker._probe_thread.is_alive()
+
+    gate.release()
+    _wait_for_probe(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_errors_rejected_by_is_failure_are_not_recorded():
+    breaker = CircuitBreaker(failure_threshold=1, probe=lambda: None,
+                             is_failure=lambda error: not isinstance(error, ValueError))
+
+    def _bad_request():
+        raise ValueError("prompt too long")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            breaker.call(_bad_request)
+
+    assert breaker.state == CircuitBreaker.CLOSED
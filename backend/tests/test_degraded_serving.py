@@ -0,0 +1,127 @@
+import json
+
+import pytest
+
+import ai_engine
+from ai_engine import InvalidProviderResponseError, ProviderUnavailableError
+
+
+TUTOR_ARGS = ("Physics", "Beginner", "What is inertia?", "Text-based", "None", "English")
+
+
+def _quiz_reply(count, prefix="Q"):
+    return json.dumps([
+        {"question": f"{prefix}{i}", "options": ["a", "b", "c", "d"], "correct_answer": "a"}
+        for i in range(count)
+    ])
+
+
+def test_tutor_serves_cached_explanation_when_provider_fails(provider):
+    provider.reply = lambda prompt, api_key: "Inertia is resistance to changes in motion."
+    fresh = ai_engine.generate_tutoring_response(*TUTOR_ARGS)
+    assert fresh["degraded"] is False
+
+    def _down(prompt, api_key):
+        raise provider.status_error(503)
+
+    provider.reply = _down
+    cached = ai_engine.generate_tutoring_response(*TUTOR_ARGS)
+
+    assert cached == {"response": fresh["response"], "degraded": True}
+
+
+def test_tutor_cache_miss_while_open_is_unavailable(provider):
+    def _down(prompt, api_key):
+        raise provider.status_error(500)
+
+    provider.reply = _down
+    for _ in range(2):
+        with pytest.raises(Exception, match="Failed to generate tutoring response"):
+            ai_engine.generate_tutoring_response(*TUTOR_ARGS)
+    assert provider.breaker.is_open()
+
+    calls_before = len(provider.calls)
+    with pytest.raises(ProviderUnavailableError):
+        ai_engine.generate_tutoring_response("Physics", "Beginner", "What is mass?", "Text-based", "None", "English")
+    assert len(provider.calls) == calls_before
+
+
+def test_client_errors_do_not_open_the_circuit(provider):
+    def _rejected(prompt, api_key):
+        raise provider.status_error(400)
+
+    provider.reply = _rejected
+    for _ in range(3):
+        with pytest.raises(Exception, match="Failed to generate tutoring response"):
+            ai_engine.generate_tutoring_response(*TUTOR_ARGS)
+
+    assert not provider.breaker.is_open()
+
+
+def test_non_provider_errors_are_not_served_from_cache(provider, monkeypatch):
+    provider.reply = lambda prompt, api_key: "Inertia is resistance to changes in motion."
+    ai_engine.generate_tutoring_response(*TUTOR_ARGS)
+
+    def _broken(content, learning_style):
+        raise KeyError("formatting bug")
+
+    monkeypatch.setattr(ai_engine, "_format_tutoring_response", _broken)
+    with pytest.raises(KeyError):
+        ai_engine.generate_tutoring_response(*TUTOR_ARGS)
+
+
+def test_quiz_serves_stored_questions_during_outage(provider):
+    provider.reply = lambda prompt, api_key: _quiz_reply(3)
+    fresh = ai_engine.generate_quiz("Chemistry", "Beginner", 3, reveal_answer=False)
+    assert fresh["degraded"] is False
+
+    def _down(prompt, api_key):
+        raise provider.status_error(502)
+
+    provider.reply = _down
+    stored = ai_engine.generate_quiz("chemistry", "beginner", 3)
+
+    assert stored["degraded"] is True
+    assert sorted(q["question"] for q in stored["quiz_data"]) == ["Q0", "Q1", "Q2"]
+    assert "formatted_quiz" in stored
+
+
+def test_quiz_outage_with_empty_bank_while_open_is_unavailable(provider):
+    def _down(prompt, api_key):
+        raise provider.status_error(500)
+
+    provider.reply = _down
+    for _ in range(2):
+        with pytest.raises(Exception, match="Failed to generate quiz"):
+            ai_engine.generate_quiz("Biology", "Beginner", 3)
+
+    with pytest.raises(ProviderUnavailableError):
+        ai_engine.generate_quiz("Biology", "Beginner", 3)
+
+
+def test_unparseable_quiz_serves_stored_questions_as_degraded(provider):
+    provider.reply = lambda prompt, api_key: _quiz_reply(3)
+    ai_engine.generate_quiz("Chemistry", "Beginner", 3)
+
+    provider.reply = lambda prompt, api_key: "Sorry, I cannot help with that."
+    result = ai_engine.generate_quiz("Chemistry", "Beginner", 3, reveal_answer=False)
+
+    assert result["degraded"] is True
+    assert len(result["quiz_data"]) == 3
+
+
+def test_unparseable_quiz_with_empty_bank_raises(provider):
+    provider.reply = lambda prompt, api_key: "Sorry, I cannot help with that."
+
+    with pytest.raises(InvalidProviderResponseError):
+        ai_engine.generate_quiz("Chemistry", "Beginner", 3)
+
+
+def test_question_bank_is_capped_by_topic(provider, monkeypatch):
+    monkeypatch.setattr(ai_engine, "QUESTION_BANK_TOPICS", 2)
+    question = {"question": "Q", "options": ["a", "b", "c", "d"], "correct_answer": "a"}
+
+    for subject in ("Math", "Physics", "History"):
+        ai_engine._store_quiz_questions(subject, "Beginner", [question])
+
+    assert list(ai_engine._question_bank) == [("physics", "beginner"), ("history", "beginner")]
@@ -0,0 +1,230 @@
+import threading
+import time
+
+import pytest
+
+import ai_engine
+from provider_pool import (
+    WINDOW_SECONDS,
+    KeySlot,
+    PoolSaturatedError,
+    ProviderPool,
+    _parse_duration,
+    _retry_after_seconds,
+    build_pool_from_env,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, total_tokens):
+        self.response_metadata = {"token_usage": {"total_tokens": total_tokens}}
+
+
+class RateLimitError(Exception):
+    def __init__(self, headers=None):
+        super().__init__("rate limited")
+        self.status_code = 429
+        self.response = type("Response", (), {"status_code": 429, "headers": headers or {}})()
+
+
+def test_slot_window_expires_old_usage():
+    slot = KeySlot("key-1", "k", rpm_limit=2, tpm_limit=1000)
+    slot.reserve(0.0, 400)
+    slot.reserve(10.0, 400)
+
+    assert slot.remaining(10.0) == (0, 200)
+    assert slot.headroom(10.0, 100) is None
+    assert slot.next_available(10.0) == WINDOW_SECONDS
+
+    assert slot.remaining(WINDOW_SECONDS) == (1, 600)
+    assert slot.remaining(WINDOW_SECONDS + 10.0) == (2, 1000)
+
+
+def test_slot_allows_oversized_call_only_when_idle():
+    slot = KeySlot("key-1", "k", rpm_limit=10, tpm_limit=1000)
+    assert slot.headroom(0.0, 5000) == 0.0
+
+    slot.reserve(0.0, 1)
+    assert slot.headroom(0.0, 5000) is None
+
+
+def test_acquire_picks_key_with_most_headroom():
+    clock = FakeClock()
+    busy = KeySlot("busy", "a", rpm_limit=10, tpm_limit=1000)
+    idle = KeySlot("idle", "b", rpm_limit=10, tpm_limit=1000)
+    busy.reserve(clock(), 800)
+    pool = ProviderPool([busy, idle], clock=clock)
+
+    assert pool.acquire(100).slot is idle
+
+    # Token headroom matters as well as request headroom
+    idle.reserve(clock(), 100)
+    idle.reserve(clock(), 100)
+    assert pool.acquire(100).slot is idle
+    assert busy.headroom(clock(), 100) < idle.headroom(clock(), 100)
+
+
+def test_acquire_skips_keys_in_cooldown():
+    clock = FakeClock()
+    first = KeySlot("first", "a")
+    second = KeySlot("second", "b")
+    pool = ProviderPool([first, second], clock=clock)
+
+    reservation = pool.acquire(100)
+    pool.release(reservation, error=RateLimitError({"retry-after": "30"}))
+    cooled = reservation.slot
+
+    assert cooled.cooldown_until == clock() + 30
+    assert all(pool.acquire(10).slot is not cooled for _ in range(3))
+
+    clock.advance(31)
+    assert any(pool.acquire(10).slot is cooled for _ in range(5))
+
+
+def test_acquire_waits_then_raises_when_saturated():
+    slot = KeySlot("key-1", "k", rpm_limit=1, tpm_limit=1000)
+    pool = ProviderPool([slot], max_wait=0.2)
+    pool.acquire(100)
+
+    start = time.monotonic()
+    with pytest.raises(PoolSaturatedError):
+        pool.acquire(100)
+    assert time.monotonic() - start >= 0.2
+
+
+def test_release_wakes_queued_acquire():
+    slot = KeySlot("key-1", "k", rpm_limit=1, tpm_limit=1000)
+    pool = ProviderPool([slot], max_wait=5.0)
+    reservation = pool.acquire(100)
+
+    result = {}
+
+    def _queued():
+        start = time.monotonic()
+        result["slot"] = pool.acquire(100).slot
+        result["waited"] = time.monotonic() - start
+
+    thread = threading.Thread(target=_queued)
+    thread.start()
+    time.sleep(0.1)
+    pool.release(reservation, refund=True)
+    thread.join(timeout=5)
+
+    assert result["slot"] is slot
+    assert result["waited"] < 1.0
+
+
+def test_release_corrects_tokens_from_response():
+    slot = KeySlot("key-1", "k", rpm_limit=10, tpm_limit=1000)
+    pool = ProviderPool([slot], clock=FakeClock())
+    reservation = pool.acquire(500)
+
+    pool.release(reservation, response=FakeResponse(120))
+
+    assert slot.remaining(pool.clock()) == (9, 880)
+
+
+def test_release_gives_back_budget_of_non_rate_limit_failures():
+    slot = KeySlot("key-1", "k", rpm_limit=10, tpm_limit=1000)
+    pool = ProviderPool([slot], clock=FakeClock())
+
+    pool.release(pool.acquire(500), error=RuntimeError("connection reset"))
+    pool.release(pool.acquire(500), refund=True)
+
+    assert slot.remaining(pool.clock()) == (10, 1000)
+    assert slot.cooldown_until == 0.0
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("7.66", 7.66),
+    ("2m59.56s", 179.56),
+    ("450ms", 0.45),
+    ("1h2m", 3720.0),
+    ("soon", None),
+    ("5x", None),
+    ("12", 12.0),
+])
+def test_parse_duration(value, expected):
+    result = _parse_duration(value)
+    if expected is None:
+        assert result is None
+    else:
+        assert result == pytest.approx(expected)
+
+
+def test_retry_after_seconds():
+    assert _retry_after_seconds(RuntimeError("boom")) is None
+    assert _retry_after_seconds(RateLimitError({"retry-after": "3"})) == 3.0
+    assert _retry_after_seconds(RateLimitError({"x-ratelimit-reset-tokens": "1m30s"})) == 90.0
+    assert _retry_after_seconds(RateLimitError({"retry-after": "later"})) == WINDOW_SECONDS
+    assert _retry_after_seconds(RateLimitError()) == WINDOW_SECONDS
+
+
+def test_build_pool_from_env():
+    pool = build_pool_from_env({
+        "GROQ_API_KEYS": "a, b ,",
+        "GROQ_API_BASES": ",https://b.example",
+        "OPENAI_API_KEY": "ignored",
+        "GROQ_RPM_LIMIT": "5",
+    })
+    assert [(slot.api_key, slot.api_base, slot.rpm_limit) for slot in pool.slots] == [
+        ("a", None, 5),
+        ("b", "https://b.example", 5),
+    ]
+
+    fallback = build_pool_from_env({"OPENAI_API_KEY": "single"})
+    assert [slot.api_key for slot in fallback.slots] == ["single"]
+
+
+def test_rate_limited_call_is_retried_on_another_key(provider):
+    def _reply(prompt, api_key):
+        if api_key == "key-a":
+            raise provider.status_error(429, headers={"retry-after": "30"})
+        return "Inertia is resistance to changes in motion."
+
+    provider.reply = _reply
+    result = ai_engine.generate_tutoring_response("Physics", "Beginner", "What is inertia?", "Text-based", "None", "English")
+
+    assert result["degraded"] is False
+    # Both keys are idle, so the first one is tried first
+    assert [api_key for api_key, _ in provider.calls] == ["key-a", "key-b"]
+    assert provider.pool.slots[0].cooldown_until > provider.pool.clock()
+    assert provider.breaker._failures == 0
+
+
+def test_rate_limits_on_every_key_make_provider_unavailable(provider):
+    def _reply(prompt, api_key):
+        raise provider.status_error(429)
+
+    provider.reply = _reply
+    with pytest.raises(ai_engine.ProviderUnavailableError):
+        ai_engine.generate_tutoring_response("Physics", "Beginner", "What is inertia?", "Text-based", "None", "English")
+
+    assert sorted(api_key for api_key, _ in provider.calls) == ["key-a", "key-b"]
+    assert not provider.breaker.is_open()
+
+
+def test_llm_client_does_not_retry_on_its_own():
+    llm = ai_engine.get_llm(KeySlot("key-1", "test-key"))
+    assert llm.max_retries == 0
+
+
+def test_acquire_respects_explicit_deadline():
+    clock = FakeClock()
+    slot = KeySlot("key-1", "k", rpm_limit=1, tpm_limit=1000)
+    pool = ProviderPool([slot], max_wait=10.0, clock=clock)
+    pool.acquire(100)
+
+    with pytest.raises(PoolSaturatedError):
+        pool.acquire(100, deadline=clock())
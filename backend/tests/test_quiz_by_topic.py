@@ -0,0 +1,171 @@
+import json
+import re
+import threading
+
+import pytest
+
+import ai_engine
+from circuit_breaker import CircuitOpenError
+
+
+class FakeLLM:
+    """
+    Stands in for ai_engine._invoke_llm, answering planner, per-question and
+    single-prompt quiz requests separately.
+    """
+
+    def __init__(self, subtopics):
+        self.subtopics = subtopics
+        self.question = self._default_question
+        self.single_prompt = self._default_single_prompt
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, completion_tokens=1024):
+        with self._lock:
+            self.prompts.append(prompt)
+
+        if "List exactly" in prompt:
+            return self.subtopics
+        subtopic = re.search(r'subtopic "([^"]*)"', prompt)
+        if subtopic:
+            variant = re.search(r"question #(\d+)", prompt)
+            return self.question(subtopic.group(1), int(variant.group(1)) if variant else 1)
+        count = int(re.search(r"exactly (\d+) multiple-choice", prompt).group(1))
+        return self.single_prompt(count)
+
+    @staticmethod
+    def _default_question(subtopic, number):
+        return json.dumps(_question(f"{subtopic} #{number}"))
+
+    @staticmethod
+    def _default_single_prompt(count):
+        return json.dumps([_question(f"Single {i}") for i in range(count)])
+
+    def count(self, kind):
+        markers = {"plan": "List exactly", "question": 'subtopic "', "single": "multiple-choice questions"}
+        return sum(markers[kind] in prompt for prompt in self.prompts)
+
+
+def _question(text):
+    return {"question": text, "options": ["a", "b", "c", "d"], "correct_answer": "a"}
+
+
+@pytest.fixture
+def llm(provider, monkeypatch):
+    fake = FakeLLM('["Limits", "Derivatives", "Integrals"]')
+    monkeypatch.setattr(ai_engine, "_invoke_llm", fake)
+    return fake
+
+
+def _questions(result):
+    return [question["question"] for question in result["quiz_data"]]
+
+
+def test_parse_subtopics_deduplicates_normalized_names():
+    content = 'Here you go: ["Limits", "  limits ", "Derivatives", "", "Chain   Rule"]'
+
+    assert ai_engine._parse_subtopics(content, 5) == ["Limits", "Derivatives", "Chain Rule"]
+    assert ai_engine._parse_subtopics(content, 2) == ["Limits", "Derivatives"]
+
+
+@pytest.mark.parametrize("content", ["no json here", '{"topic": "Limits"}', '["", "  "]'])
+def test_parse_subtopics_rejects_malformed_plans(content):
+    with pytest.raises(ValueError):
+        ai_engine._parse_subtopics(content, 3)
+
+
+def test_plan_question_slots_adds_variants():
+    assert ai_engine._plan_question_slots(["A", "B"], 5) == [("A", 0), ("B", 0), ("A", 1), ("B", 1), ("A", 2)]
+
+
+def test_by_topic_quiz_generates_one_question_per_subtopic(llm):
+    result = ai_engine.generate_quiz("Math", "Beginner", 3, reveal_answer=False, by_topic=True)
+
+    assert _questions(result) == ["Limits #1", "Derivatives #1", "Integrals #1"]
+    assert result["degraded"] is False
+    assert (llm.count("plan"), llm.count("question"), llm.count("single")) == (1, 3, 0)
+
+
+def test_fewer_subtopics_than_questions_uses_variants(llm):
+    llm.subtopics = '["Limits", "limits", "Derivatives"]'
+
+    result = ai_engine.generate_quiz("Math", "Beginner", 5, reveal_answer=False, by_topic=True)
+
+    assert _questions(result) == ["Limits #1", "Derivatives #1", "Limits #2", "Derivatives #2", "Limits #3"]
+    assert llm.count("single") == 0
+
+
+def test_second_quiz_reuses_cached_questions(llm):
+    llm.subtopics = '["Limits", "Derivatives"]'
+    first = ai_engine.generate_quiz("Math", "Beginner", 4, reveal_answer=False, by_topic=True)
+    llm.prompts.clear()
+
+    second = ai_engine.generate_quiz("math", "beginner", 4, reveal_answer=False, by_topic=True)
+
+    assert _questions(second) == _questions(first)
+    assert (llm.count("plan"), llm.count("question")) == (1, 0)
+    # The planner is offered the cached subtopics for reuse
+    assert '"limits"' in llm.prompts[0] and '"derivatives"' in llm.prompts[0]
+
+
+def test_malformed_item_is_topped_up_with_single_prompt(llm):
+    def _question_reply(subtopic, number):
+        if subtopic == "Derivatives":
+            return "not json"
+        return json.dumps(_question(f"{subtopic} #{number}"))
+
+    llm.question = _question_reply
+
+    result = ai_engine.generate_quiz("Math", "Beginner", 3, reveal_answer=False, by_topic=True)
+
+    assert _questions(result) == ["Limits #1", "Integrals #1", "Single 0"]
+    assert "exactly 1 multiple-choice" in llm.prompts[-1]
+
+
+def test_short_by_topic_quiz_falls_back_to_single_prompt(llm):
+    llm.question = lambda subtopic, number: json.dumps(_question("Same question"))
+    llm.single_prompt = lambda count: json.dumps([_question("Same question")] if count < 3 else
+                                                 [_question(f"Single {i}") for i in range(count)])
+
+    result = ai_engine.generate_quiz("Math", "Beginner", 3, reveal_answer=False, by_topic=True)
+
+    assert _questions(result) == ["Single 0", "Single 1", "Single 2"]
+    assert result["degraded"] is False
+
+
+def test_malformed_plan_falls_back_to_single_prompt(llm):
+    llm.subtopics = "I could not think of any subtopics."
+
+    result = ai_engine.generate_quiz("Math", "Beginner", 3, reveal_answer=False, by_topic=True)
+
+    assert _questions(result) == ["Single 0", "Single 1", "Single 2"]
+    assert result["degraded"] is False
+    assert llm.count("question") == 0
+
+
+def test_open_circuit_during_fan_out_skips_top_up(llm):
+    ai_engine._store_quiz_questions("Math", "Beginner", [_question("Stored 0"), _question("Stored 1")])
+
+    def _question_reply(subtopic, number):
+        if subtopic == "Integrals":
+            raise CircuitOpenError("circuit open")
+        return json.dumps(_question(f"{subtopic} #{number}"))
+
+    llm.question = _question_reply
+
+    result = ai_engine.generate_quiz("Math", "Beginner", 3, reveal_answer=False, by_topic=True)
+
+    assert result["degraded"] is True
+    assert sorted(_questions(result)) == ["Stored 0", "Stored 1"]
+    assert llm.count("single") == 0
+
+
+def test_programming_errors_in_fan_out_surface(llm, monkeypatch):
+    def _broken(subject, level, subtopic, variant=0):
+        raise TypeError("bug")
+
+    monkeypatch.setattr(ai_engine, "_generate_topic_question", _broken)
+
+    with pytest.raises(TypeError):
+        ai_engine.generate_quiz("Math", "Beginner", 3, by_topic=True)
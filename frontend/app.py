@@ -37,6 +37,8 @@ with tab1:
                     "background": background,
                     "language": language
                 }).json()
+                if response.get('degraded'):
+                    st.warning("The AI service is busy right now, so this is a previously generated explanation.")
                 st.success("Here's your personalized explanation:")
                 st.markdown(response['response'],
                 unsafe_allow_html=True)
@@ -49,6 +51,7 @@ with tab2:
     col1, col2 = st.columns([2, 1])
     with col1:
         num_questions = st.slider("Number of Questions", min_value=1, max_value=10, value=5)
+        by_topic = st.checkbox("Faster quiz (one question per subtopic, generated in parallel)")
     with col2:
         quiz_button = st.button("Generate Quiz", use_container_width=True)
     if quiz_button:
@@ -58,8 +61,11 @@ with tab2:
                     "subject": subject,
                     "level": level,
                     "num_questions": num_questions,
-                    "reveal_format": True
+                    "reveal_format": True,
+                    "by_topic": by_topic
                 }).json()
+                if response.get('degraded'):
+                    st.warning("The AI service is busy right now, so this quiz uses previously generated questions.")
                 st.success("Quiz generated! Answer the questions below:")
                 
                 if 'formatted_quiz' in response and response['formatted_quiz']: